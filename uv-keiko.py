@@ -10,52 +10,221 @@ Prerequisites:
 - tomli-w: pip install tomli-w
 - requests: pip install requests
 - packaging: pip install packaging
+- orjson (optional, faster parsing of PyPI responses): pip install orjson
+- rtoml (optional, faster reading of large TOML files): pip install rtoml
 
 Usage:
-python uv-keiko.py [--dry-run] [--no-backup] [--pyproject PATH]
+python uv-keiko.py [--dry-run] [--no-backup] [--refresh] [--pre] [--verbose] [--pyproject PATH]
 """
 
 import argparse
+import contextlib
+import functools
+import json
+import logging
+import os
 import re
 import shutil
 import subprocess
 import sys
 import tempfile
+import time
 import tomllib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 
 try:
     import requests
     import tomli_w
     from packaging import version
-    from packaging.requirements import Requirement
+    from packaging.requirements import InvalidRequirement, Requirement
+    from packaging.specifiers import InvalidSpecifier, SpecifierSet
+    from packaging.utils import (InvalidSdistFilename, InvalidWheelFilename, canonicalize_name,
+                                 parse_sdist_filename, parse_wheel_filename)
+    from urllib3.util.retry import Retry
 except ImportError as e:
     print(f"Error: Required library not installed: {e}")
     print("Install with: pip install requests tomli-w packaging")
     sys.exit(1)
 
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+# rtoml only reads: its writer moves and reformats tables (e.g. include-group entries)
+try:
+    import rtoml
+    toml_loads = rtoml.loads
+except ImportError:
+    toml_loads = tomllib.loads
+
+# Parsed versions are cached: the same release lists are scanned by the prefetch and the
+# update loop. Unbounded, because a bounded LRU thrashes on packages with thousands of releases
+parse_version = functools.lru_cache(maxsize=None)(version.parse)
+
+# Maximum number of concurrent requests to PyPI
+MAX_WORKERS = 20
+
+# Maximum number of retries for failed PyPI requests (rate limits, server and connection errors)
+MAX_RETRIES = 3
+
+# Content type of the PyPI simple JSON API (PEP 691)
+SIMPLE_JSON_CONTENT_TYPE = 'application/vnd.pypi.simple.v1+json'
+
+# Fallback pattern for requirement names (with optional extras) that packaging cannot parse
+REQUIREMENT_NAME_PATTERN = re.compile(r'^([a-zA-Z0-9_-]+)(\[.*\])?')
+
+# Version number in a single constraint such as '>=1.2.3'
+CONSTRAINT_VERSION_PATTERN = re.compile(r'[><=~!]*\s*([0-9]+(?:\.[0-9]+)*(?:\.?[0-9a-zA-Z-]+)*)')
+
+# Directory for PyPI responses cached between runs
+CACHE_DIR = Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / 'uv-keiko'
+
+# Seconds a cached PyPI response is used without revalidating it
+CACHE_TTL = 600
+
+# Latest versions seen in recent runs, dependencies already on them are not looked up again
+KNOWN_LATEST_PATH = CACHE_DIR / 'known_latest.json'
+KNOWN_LATEST_TTL = 6 * 60 * 60
+
+# Per-dependency debug details are only formatted and written with --verbose
+log = logging.getLogger('uv-keiko')
+
 
 class PackageUpdater:
-    def __init__(self, pyproject_path: Path, dry_run: bool = False, backup: bool = True):
+    def __init__(self, pyproject_path: Path, dry_run: bool = False, backup: bool = True,
+                 refresh: bool = False, allow_prereleases: bool = False):
         self.pyproject_path = pyproject_path
         self.dry_run = dry_run
         self.backup = backup
+        self.refresh = refresh
+        self.allow_prereleases = allow_prereleases
         self.session = requests.Session()
         self.session.headers.update({'User-Agent': 'UV-Keiko/1.0'})
 
-        # Cache for PyPI requests
-        self.package_cache: Dict[str, dict] = {}
+        # Keep one connection per worker alive so concurrent fetches reuse TLS sessions, and
+        # retry transient failures with backoff (honouring Retry-After when rate limited)
+        retries = Retry(total=MAX_RETRIES, backoff_factor=0.3,
+                        status_forcelist=[429, 500, 502, 503, 504],
+                        allowed_methods=['GET'], raise_on_status=False)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=MAX_WORKERS,
+                                                pool_maxsize=MAX_WORKERS, max_retries=retries)
+        self.session.mount('https://', adapter)
+
+        # Cache for PyPI requests (None marks packages that could not be fetched)
+        self.package_cache: Dict[str, Optional[dict]] = {}
+        self.simple_cache: Dict[str, Optional[dict]] = {}
+
+        # Raw pyproject.toml as read from disk, used as the backup snapshot
+        self.original_content: Optional[bytes] = None
+
+        # Latest versions resolved by 'uv pip compile', keyed by canonical name
+        self.resolved_versions: Dict[str, str] = {}
+
+        # Oldest Python the project supports (from requires-python), uv resolves for it
+        self.python_version: Optional[str] = None
+
+        # Latest versions seen in recent runs: canonical name -> (version, timestamp)
+        self.known_latest: Dict[str, Tuple[str, float]] = {}
+
+    def load_known_latest(self) -> None:
+        """Loads the latest versions seen within the last KNOWN_LATEST_TTL seconds"""
+        if self.allow_prereleases:
+            return  # The cache only holds stable versions
+
+        try:
+            entries = json_loads(KNOWN_LATEST_PATH.read_bytes())
+            cutoff = time.time() - KNOWN_LATEST_TTL
+            self.known_latest = {name: (ver, seen) for name, (ver, seen) in entries.items()
+                                 if seen >= cutoff}
+        except (OSError, ValueError, TypeError, AttributeError):
+            self.known_latest = {}  # Missing or corrupt, start over
+
+    def save_known_latest(self) -> None:
+        """Stores the latest versions seen in this run for later runs"""
+        if self.allow_prereleases:
+            return
+
+        try:
+            KNOWN_LATEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+            KNOWN_LATEST_PATH.write_text(json.dumps(self.known_latest))
+        except OSError as e:
+            print(f"⚠️  Warning: Could not write cache file {KNOWN_LATEST_PATH}: {e}")
+
+    def is_known_latest(self, package_name: str, pinned_version: Optional[str]) -> bool:
+        """Checks if a pinned version was recently seen as the latest version of a package"""
+        if self.refresh or not pinned_version:
+            return False
+        known = self.known_latest.get(canonicalize_name(package_name))
+        return known is not None and known[0] == pinned_version
 
     def create_backup(self) -> None:
         """Creates a backup of the pyproject.toml file"""
-        if self.backup and self.pyproject_path.exists():
+        if self.backup and self.original_content is not None:
             backup_path = self.pyproject_path.with_suffix('.toml.backup')
-            shutil.copy2(self.pyproject_path, backup_path)
+            backup_path.write_bytes(self.original_content)
             print(f"✓ Backup created: {backup_path}")
 
+    def _fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        """Performs a GET request against PyPI (the session adapter retries transient errors)"""
+        response = self.session.get(url, headers=headers, timeout=15)
+        response.raise_for_status()
+        return response
+
+    def _fetch_json(self, url: str, cache_path: Path,
+                    headers: Optional[Dict[str, str]] = None) -> dict:
+        """Fetches a JSON document from PyPI, using the copy cached on disk when possible"""
+        request_headers = dict(headers or {})
+        etag_path = cache_path.with_suffix('.etag')
+
+        try:
+            cached = cache_path.read_bytes()
+            cache_age = time.time() - cache_path.stat().st_mtime
+            etag = etag_path.read_text() if etag_path.exists() else None
+        except OSError:
+            cached = None
+
+        if cached is not None and not self.refresh and cache_age < CACHE_TTL:
+            # Recently fetched, use it without contacting PyPI at all
+            try:
+                return json_loads(cached)
+            except ValueError:
+                cached = None  # Corrupt cache entry, fetch a fresh copy
+
+        if cached is not None and etag:
+            # Revalidate the cached copy, PyPI answers 304 if it is still current
+            request_headers['If-None-Match'] = etag
+
+        response = self._fetch(url, headers=request_headers)
+
+        if response.status_code == 304 and cached is not None:
+            try:
+                data = json_loads(cached)
+            except ValueError:
+                # Corrupt cache entry, fetch a fresh copy
+                response = self._fetch(url, headers=headers)
+            else:
+                with contextlib.suppress(OSError):
+                    cache_path.touch()  # Restart the TTL
+                return data
+
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            cache_path.write_bytes(response.content)
+            etag = response.headers.get('ETag')
+            if etag:
+                etag_path.write_text(etag)
+            else:
+                etag_path.unlink(missing_ok=True)
+        except OSError as e:
+            print(f"⚠️  Warning: Could not write cache file {cache_path}: {e}")
+
+        return json_loads(response.content)
+
     def get_package_info(self, package_name: str) -> Optional[dict]:
-        """Fetches package information from PyPI"""
+        """Fetches the latest and the installable versions of a package from the PyPI JSON API"""
         # Normalize package name for PyPI (lowercase, underscores to hyphens)
         normalized_name = package_name.lower().replace('_', '-')
 
@@ -64,30 +233,191 @@ class PackageUpdater:
 
         try:
             url = f"https://pypi.org/pypi/{normalized_name}/json"
-            response = self.session.get(url, timeout=15)
-            response.raise_for_status()
-
-            data = response.json()
-            self.package_cache[normalized_name] = data
-            return data
-
-        except requests.RequestException as e:
+            data = self._fetch_json(url, CACHE_DIR / 'pypi' / f"{normalized_name}.json")
+            # Keep only what version selection needs, release histories can be megabytes
+            info = {
+                'version': data['info']['version'],
+                # Releases without files or with only yanked files cannot be installed
+                'versions': [ver for ver, files in data.get('releases', {}).items()
+                             if any(not file.get('yanked') for file in files)],
+            }
+            self.package_cache[normalized_name] = info
+            return info
+
+        except (requests.RequestException, ValueError, KeyError) as e:
             print(f"⚠️  Warning: Could not fetch package info for {package_name}: {e}")
+            self.package_cache[normalized_name] = None
             return None
 
-    def get_latest_version(self, package_name: str) -> Optional[str]:
-        """Gets the latest stable version of a package from PyPI"""
-        info = self.get_package_info(package_name)
-        if not info:
-            return None
+    def get_simple_index(self, package_name: str) -> Optional[dict]:
+        """Fetches the version list of a package from the PyPI simple JSON API (PEP 691)"""
+        normalized_name = package_name.lower().replace('_', '-')
+
+        if normalized_name in self.simple_cache:
+            return self.simple_cache[normalized_name]
+
+        try:
+            # The simple index only lists versions and files, a fraction of /pypi/{name}/json
+            url = f"https://pypi.org/simple/{normalized_name}/"
+            data = self._fetch_json(url, CACHE_DIR / 'simple' / f"{normalized_name}.json",
+                                    headers={'Accept': SIMPLE_JSON_CONTENT_TYPE})
+            # Keep only what version selection needs, file lists can be megabytes
+            data = {
+                'versions': data.get('versions', []),
+                'yanked': self.yanked_versions(data.get('files', [])),
+            }
+        except (requests.RequestException, ValueError):
+            # Callers fall back to the full JSON API, which reports its own errors
+            data = None
+
+        self.simple_cache[normalized_name] = data
+        return data
+
+    def resolve_latest_with_uv(self, requirements: List[str]) -> Dict[str, str]:
+        """Resolves the latest compatible versions of requirements in one 'uv pip compile' run"""
+        if not requirements or not shutil.which('uv'):
+            return {}
+
+        print(f"🔍 Resolving {len(requirements)} requirements with 'uv pip compile'...")
+
+        try:
+            args = ['pip', 'compile', '--upgrade', '--quiet', '--no-header', '--no-annotate']
+            if self.python_version:
+                # Resolve for the project's Python, not the one running this script
+                args.append(f'--python-version={self.python_version}')
+            if self.allow_prereleases:
+                args.append('--prerelease=allow')
+            result = self.run_uv([*args, '-'], input='\n'.join(requirements))
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"⚠️  Warning: 'uv pip compile' failed, falling back to PyPI: {e}")
+            return {}
+
+        if result.returncode != 0:
+            print("⚠️  Warning: 'uv pip compile' could not resolve, falling back to PyPI")
+            return {}
+
+        # Output lines look like 'name==1.2.3' (optionally followed by '; marker')
+        resolved = {}
+        for line in result.stdout.splitlines():
+            requirement, _, _ = line.partition(';')
+            name, separator, resolved_version = requirement.partition('==')
+            if separator and not name.startswith('#'):
+                resolved[canonicalize_name(name.strip())] = resolved_version.strip()
+
+        return resolved
+
+    def prefetch_package_info(self, package_names: List[str],
+                              requirements: Optional[List[str]] = None) -> None:
+        """Fetches version information for multiple packages concurrently
+
+        requirements (default: the bare package names) are resolved by uv; they should
+        carry the current lower bounds, so uv never picks a version older than those.
+        """
+        unique_names = sorted(set(package_names))
+        self.resolved_versions.update(self.resolve_latest_with_uv(requirements or unique_names))
+
+        # Only packages uv could not resolve need to be looked up on PyPI
+        unique_names = [name for name in unique_names
+                        if canonicalize_name(name) not in self.resolved_versions]
+        if not unique_names:
+            return
+
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(unique_names))) as executor:
+            # Results land in the caches, so we only need to wait for completion
+            list(executor.map(self.fetch_version_info, unique_names))
+
+    def fetch_version_info(self, package_name: str) -> None:
+        """Fetches everything get_latest_version needs for a package into the caches"""
+        index = self.get_simple_index(package_name)
+        if not index or not self.select_latest_from_index(index):
+            # get_latest_version will fall back to the full JSON API, fetch it now as well
+            self.get_package_info(package_name)
+
+    def select_latest_version(self, versions: List[str],
+                              excluded: Optional[Set[version.Version]] = None) -> Optional[str]:
+        """Selects the latest version from a list of versions, skipping pre-releases unless allowed"""
+        # Single pass that parses every version once, instead of filtering and sorting
+        best = None
+        best_parsed = None
+        for ver in versions:
+            try:
+                parsed = parse_version(ver)
+            except version.InvalidVersion:
+                continue
+
+            if (parsed.is_prerelease and not self.allow_prereleases) or (
+                    excluded and parsed in excluded):
+                continue
+            if best_parsed is None or parsed > best_parsed:
+                best, best_parsed = ver, parsed
+
+        return best
+
+    @staticmethod
+    def yanked_versions(files: List[dict]) -> Set[version.Version]:
+        """Collects the yanked versions from the file list of a simple index"""
+        # PyPI yanks whole releases, so the versions of yanked files are the yanked versions
+        yanked = set()
+        for file in files:
+            if not file.get('yanked'):
+                continue
+            filename = file.get('filename', '')
+            try:
+                if filename.endswith('.whl'):
+                    yanked.add(parse_wheel_filename(filename)[1])
+                else:
+                    yanked.add(parse_sdist_filename(filename)[1])
+            except (InvalidWheelFilename, InvalidSdistFilename):
+                continue
+
+        return yanked
 
-        # Get the latest version from PyPI
-        latest = info['info']['version']
-        print(f"  📡 PyPI latest for {package_name}: {latest}")
+    def select_latest_from_index(self, index: dict) -> Optional[str]:
+        """Selects the latest non-yanked version listed in a simple index"""
+        return self.select_latest_version(index['versions'], index['yanked'])
+
+    def get_latest_version(self, package_name: str) -> Optional[str]:
+        """Gets the latest stable version of a package, as resolved by uv or from PyPI"""
+        resolved = self.resolved_versions.get(canonicalize_name(package_name))
+        if resolved:
+            log.debug("  📡 uv resolved latest for %s: %s", package_name, resolved)
+            return resolved
+
+        index = self.get_simple_index(package_name)
+        latest = self.select_latest_from_index(index) if index else None
+
+        if not latest:
+            # Fall back to the full JSON API
+            info = self.get_package_info(package_name)
+            if not info:
+                return None
+            # info.version is the newest upload, which may be yanked or a pre-release
+            latest = self.select_latest_version(info['versions']) or info['version']
+
+        log.debug("  📡 PyPI latest for %s: %s", package_name, latest)
         return latest
 
-    def parse_requirement(self, req_string: str) -> Tuple[str, str, str, str]:
+    @staticmethod
+    def lower_bound(specifiers: str, operators: Tuple[str, ...] = ('>=', '~=', '==', '===')) -> Optional[str]:
+        """Returns the highest lower bound in a specifier set like '>=2,<3', as written
+
+        Raises InvalidSpecifier if the specifier set cannot be parsed.
+        """
+        bounds = []
+        for spec in SpecifierSet(specifiers):
+            if spec.operator in operators:
+                bound = spec.version.removesuffix('.*')
+                try:
+                    bounds.append((parse_version(bound), bound))
+                except version.InvalidVersion:
+                    continue
+        return max(bounds)[1] if bounds else None
+
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def parse_requirement(req_string: str) -> Tuple[str, str, str, str]:
         """Parses a requirement string and returns original_name, normalized_name, constraint, extras"""
+        # Cached: each requirement is parsed by the prefetch, the update loop and later passes
         try:
             req = Requirement(req_string.strip())
             original_name = req.name  # Keep original casing
@@ -104,7 +434,7 @@ class PackageUpdater:
         except Exception as e:
             print(f"⚠️  Warning: Could not parse requirement '{req_string}': {e}")
             # Fallback for simple names
-            match = re.match(r'^([a-zA-Z0-9_-]+)(\[.*\])?', req_string.strip())
+            match = REQUIREMENT_NAME_PATTERN.match(req_string.strip())
             if match:
                 name = match.group(1)
                 extras = match.group(2) or ""
@@ -114,83 +444,172 @@ class PackageUpdater:
     def extract_version_from_constraint(self, constraint: str) -> Optional[str]:
         """Extracts version number from a constraint string like '>=1.2.3'"""
         if not constraint:
-            print(f"      DEBUG: No constraint found")
+            log.debug("      No constraint found")
             return None
 
-        # Handle common patterns: >=1.2.3, ==1.2.3, ~=1.2.3, etc.
-        # Also handle complex constraints like ">=1.2.3,<2.0.0"
+        # Handle common patterns: >=1.2.3, ==1.2.3, ~=1.2.3, etc. and ranges like "<3,>=2";
+        # packaging sorts the specifiers, so the minimum is not necessarily the first one
+        try:
+            extracted = self.lower_bound(constraint, ('>=', '~=', '==', '===', '>'))
+            log.debug("      Extracted '%s' from constraint '%s'", extracted, constraint)
+            return extracted
+        except InvalidSpecifier:
+            pass
 
-        # Split by comma and take the first constraint (usually the minimum version)
+        # Not a valid specifier set, take the first constraint
         first_constraint = constraint.split(',')[0].strip()
 
         # Extract version using regex
-        match = re.search(r'[><=~!]*\s*([0-9]+(?:\.[0-9]+)*(?:\.?[0-9a-zA-Z-]+)*)',
-                          first_constraint)
+        match = CONSTRAINT_VERSION_PATTERN.search(first_constraint)
         if match:
             extracted = match.group(1)
-            print(f"      DEBUG: Extracted '{extracted}' from constraint '{constraint}'")
+            log.debug("      Extracted '%s' from constraint '%s'", extracted, constraint)
             return extracted
 
-        print(f"      DEBUG: Could not extract version from constraint '{constraint}'")
+        log.debug("      Could not extract version from constraint '%s'", constraint)
         return None
 
     def is_version_newer(self, new_version: str, old_version: Optional[str]) -> bool:
         """Checks if new_version is newer than old_version"""
         if not old_version:
-            print(f"      DEBUG: No old version, considering update needed")
+            log.debug("      No old version, considering update needed")
             return True
 
+        # Identical strings are never newer, no need to parse them
+        if new_version == old_version:
+            log.debug("      %s equals %s, no update needed", new_version, old_version)
+            return False
+
         try:
-            new_parsed = version.parse(new_version)
-            old_parsed = version.parse(old_version)
+            new_parsed = parse_version(new_version)
+            old_parsed = parse_version(old_version)
             is_newer = new_parsed > old_parsed
-            print(f"      DEBUG: Comparing {new_version} > {old_version} = {is_newer}")
+            log.debug("      Comparing %s > %s = %s", new_version, old_version, is_newer)
             return is_newer
         except version.InvalidVersion as e:
-            print(f"      DEBUG: Version parsing error ({e}), assuming update needed")
+            log.debug("      Version parsing error (%s), assuming update needed", e)
             return True  # Assume it's newer if we can't parse
 
-    def check_uv_compatibility(self, data: dict) -> bool:
-        """Test if the current pyproject.toml configuration is compatible using UV"""
+    def run_uv(self, args: List[str], cwd: Optional[Path] = None,
+               input: Optional[str] = None) -> subprocess.CompletedProcess:
+        """Runs a uv command non-interactively and captures its output"""
+        return subprocess.run(
+            ['uv', *args],
+            cwd=cwd,
+            input=input,
+            stdin=subprocess.DEVNULL if input is None else None,
+            env={**os.environ, 'UV_NO_PROGRESS': '1'},
+            capture_output=True,
+            text=True,
+            timeout=120
+        )
+
+    def start_uv(self, args: List[str], cwd: Path) -> subprocess.Popen:
+        """Starts a uv command non-interactively in the background, capturing its output"""
+        return subprocess.Popen(
+            ['uv', *args],
+            cwd=cwd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env={**os.environ, 'UV_NO_PROGRESS': '1'},
+            text=True
+        )
+
+    def wait_uv(self, process: subprocess.Popen) -> subprocess.CompletedProcess:
+        """Waits for a uv command started with start_uv, killing it if it takes too long"""
+        try:
+            stdout, stderr = process.communicate(timeout=120)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise
+        return subprocess.CompletedProcess(process.args, process.returncode, stdout, stderr)
+
+    @contextlib.contextmanager
+    def speculative_lock_upgrade(self, content: str, project_dir: Path):
+        """Starts 'uv lock --upgrade' for the fallback while the compatibility check runs
+
+        Yields the running process (None if it could not be started) and stops it on exit
+        if the fallback never needed it.
+        """
+        process = None
+        if shutil.which('uv'):
+            try:
+                project_dir.mkdir(exist_ok=True)
+                (project_dir / 'pyproject.toml').write_text(content, encoding='utf-8')
+                process = self.start_uv(['lock', '--upgrade'], cwd=project_dir)
+            except OSError:
+                process = None  # The fallback runs it again if needed
+
+        try:
+            yield process
+        finally:
+            if process is not None and process.poll() is None:
+                process.kill()
+                process.communicate()
+
+    def check_uv_compatibility(self, content: str, project_dir: Path) -> bool:
+        """Test if the serialized pyproject.toml configuration is compatible using UV"""
         if not shutil.which('uv'):
             print("⚠️  uv is not installed. Skipping compatibility check.")
             return True
 
         try:
-            # Create temporary directory and write pyproject.toml there
-            with tempfile.TemporaryDirectory() as temp_dir:
-                temp_path = Path(temp_dir) / 'pyproject.toml'
-
-                with open(temp_path, 'wb') as f:
-                    tomli_w.dump(data, f)
-
-                print("🔍 Testing dependency compatibility with UV (including dev extras)...")
-
-                # Test with uv sync --dry-run --all-extras (like make install does)
-                result = subprocess.run(
-                    ['uv', 'sync', '--dry-run', '--all-extras'],
-                    cwd=temp_dir,
-                    capture_output=True,
-                    text=True,
-                    timeout=120
-                )
-
-                if result.returncode == 0:
-                    print("✅ Dependency compatibility check passed!")
-                    return True
-                else:
-                    print("❌ Dependency compatibility check failed!")
-                    print("UV Error:")
-                    if result.stderr:
-                        print(result.stderr)
-                    if result.stdout:
-                        print(result.stdout)
-                    return False
+            # Write pyproject.toml into the scratch project directory
+            project_dir.mkdir(exist_ok=True)
+            (project_dir / 'pyproject.toml').write_text(content, encoding='utf-8')
+
+            print("🔍 Testing dependency compatibility with UV (all extras and groups)...")
+
+            # uv lock resolves every extra and dependency group at once, without the
+            # environment setup 'uv sync --dry-run' does; --dry-run leaves no lock file behind
+            result = self.run_uv(['lock', '--dry-run'], cwd=project_dir)
+
+            if result.returncode == 0:
+                print("✅ Dependency compatibility check passed!")
+                return True
+            else:
+                print("❌ Dependency compatibility check failed!")
+                print("UV Error:")
+                if result.stderr:
+                    print(result.stderr)
+                if result.stdout:
+                    print(result.stdout)
+                return False
 
         except Exception as e:
             print(f"⚠️  Error during compatibility check: {e}")
             return True  # Assume compatible if we can't test
 
+    def resolve_with_uv_lock(self, project_dir: Path, process: Optional[subprocess.Popen] = None
+                             ) -> Tuple[Optional[Dict[str, str]], str]:
+        """Lets 'uv lock --upgrade' pick compatible versions for the project in project_dir
+
+        Waits for process if 'uv lock --upgrade' was already started there.
+        Returns the resolved package versions (None if uv failed) and uv's error output.
+        """
+        print("🔧 Using 'uv lock --upgrade' to find compatible versions...")
+        if process is not None:
+            result = self.wait_uv(process)
+        else:
+            result = self.run_uv(['lock', '--upgrade'], cwd=project_dir)
+        if result.returncode != 0:
+            return None, result.stderr
+
+        lock_path = project_dir / 'uv.lock'
+        if not lock_path.exists():
+            return {}, ''
+
+        # uv.lock is TOML, read the versions from its [[package]] tables
+        lock_data = toml_loads(lock_path.read_text(encoding='utf-8'))
+        package_versions = {
+            package['name'].lower(): package['version']
+            for package in lock_data.get('package', [])
+            if 'name' in package and 'version' in package
+        }
+        return package_versions, ''
+
     def auto_resolve_psutil_safety_conflict(self, data: dict) -> dict:
         """Automatically resolve the common psutil/safety conflict"""
         print("🔧 Auto-resolving psutil/safety conflict...")
@@ -199,39 +618,13 @@ class PackageUpdater:
         print(
             "🗑️ Removing safety from dev dependencies (security scanning can be done via pre-commit)")
 
-        def remove_safety_from_deps(deps_list):
-            new_deps = []
-            for dep in deps_list:
-                if isinstance(dep, str):
-                    name, _, _, extras = self.parse_requirement(dep)
-                    if name.lower() != 'safety':
-                        new_deps.append(dep)
-                    else:
-                        print(f"  🗑️ Removed {name}: psutil version conflict")
-                else:
-                    new_deps.append(dep)
-            return new_deps
-
-        # Remove safety from optional dependencies
-        if 'project' in data and 'optional-dependencies' in data['project']:
-            for group_name, deps in data['project']['optional-dependencies'].items():
-                data['project']['optional-dependencies'][group_name] = remove_safety_from_deps(deps)
-
-        # Remove safety from dependency groups
-        if 'dependency-groups' in data:
-            for group_name, deps in data['dependency-groups'].items():
-                new_deps = []
-                for dep in deps:
-                    if isinstance(dep, str):
-                        name, _, _, extras = self.parse_requirement(dep)
-                        if name.lower() != 'safety':
-                            new_deps.append(dep)
-                        else:
-                            print(
-                                f"  🗑️ Removed {name} from group[{group_name}]: psutil version conflict")
-                    else:
-                        new_deps.append(dep)
-                data['dependency-groups'][group_name] = new_deps
+        # Main dependencies are left alone, safety only belongs to dev/optional groups
+        for group_label, deps in self.dependency_lists(data, include_main=False):
+            kept_deps = [dep for dep in deps
+                         if not (isinstance(dep, str) and self.parse_requirement(dep)[1] == 'safety')]
+            if len(kept_deps) != len(deps):
+                print(f"  🗑️ Removed safety from {group_label}: psutil version conflict")
+                deps[:] = kept_deps
 
         print("✅ Removed safety to resolve psutil conflict")
         print("💡 Consider using: ruff --select S (security rules) or bandit for security scanning")
@@ -257,115 +650,98 @@ class PackageUpdater:
         """Apply compatible versions from UV lock file to pyproject.toml data"""
         print("🔄 Applying UV-resolved compatible versions...")
 
-        # Update main dependencies
-        if 'project' in data and 'dependencies' in data['project']:
-            new_deps = []
-            for dep in data['project']['dependencies']:
-                if isinstance(dep, str):
-                    original_name, normalized_name, _, extras = self.parse_requirement(dep)
-                    if normalized_name in package_versions:
-                        compatible_version = package_versions[normalized_name]
-                        new_dep = f"{original_name}{extras}>={compatible_version}"
-                        new_deps.append(new_dep)
-                        print(f"  ✓ {original_name}: -> {compatible_version} (UV resolved)")
-                    else:
-                        new_deps.append(dep)
-                else:
-                    new_deps.append(dep)
-            data['project']['dependencies'] = new_deps
-
-        # Update optional dependencies
-        if 'project' in data and 'optional-dependencies' in data['project']:
-            for group_name, deps in data['project']['optional-dependencies'].items():
-                new_deps = []
-                for dep in deps:
-                    if isinstance(dep, str):
-                        original_name, normalized_name, _, extras = self.parse_requirement(dep)
-                        if normalized_name in package_versions:
-                            compatible_version = package_versions[normalized_name]
-                            new_dep = f"{original_name}{extras}>={compatible_version}"
-                            new_deps.append(new_dep)
-                            print(
-                                f"  ✓ {original_name} ({group_name}): -> {compatible_version} (UV resolved)")
-                        else:
-                            new_deps.append(dep)
-                    else:
-                        new_deps.append(dep)
-                data['project']['optional-dependencies'][group_name] = new_deps
-
-        # Update dependency groups
-        if 'dependency-groups' in data:
-            for group_name, deps in data['dependency-groups'].items():
-                new_deps = []
-                for dep in deps:
-                    if isinstance(dep, str):
-                        original_name, normalized_name, _, extras = self.parse_requirement(dep)
-                        if normalized_name in package_versions:
-                            compatible_version = package_versions[normalized_name]
-                            new_dep = f"{original_name}{extras}>={compatible_version}"
-                            new_deps.append(new_dep)
-                            print(
-                                f"  ✓ {original_name} (group[{group_name}]): -> {compatible_version} (UV resolved)")
-                        else:
-                            new_deps.append(dep)
-                    elif isinstance(dep, dict) and 'include-group' in dep:
-                        new_deps.append(dep)
-                    else:
-                        new_deps.append(dep)
-                data['dependency-groups'][group_name] = new_deps
+        for group_label, deps in self.dependency_lists(data):
+            deps[:] = [self.apply_compatible_version(dep, package_versions, group_label)
+                       for dep in deps]
 
         return data
 
+    def apply_compatible_version(self, dep, package_versions: Dict[str, str], group_label: str):
+        """Rewrites a single dependency to its UV-resolved version, if there is one"""
+        # Leave include-group entries (for dependency-groups) untouched
+        if not isinstance(dep, str):
+            return dep
+
+        original_name, normalized_name, _, extras = self.parse_requirement(dep)
+        if normalized_name not in package_versions:
+            return dep
+
+        compatible_version = package_versions[normalized_name]
+        group_note = "" if group_label == "main" else f" ({group_label})"
+        print(f"  ✓ {original_name}{group_note}: -> {compatible_version} (UV resolved)")
+        return f"{original_name}{extras}>={compatible_version}"
+
+    def dependency_lists(self, data: dict, include_main: bool = True) -> List[Tuple[str, list]]:
+        """Collects every dependency list in pyproject data as (group label, list) pairs"""
+        project = data.get('project', {})
+        lists = []
+        if include_main and 'dependencies' in project:
+            lists.append(("main", project['dependencies']))
+        for group_name, deps in project.get('optional-dependencies', {}).items():
+            lists.append((f"optional[{group_name}]", deps))
+        for group_name, deps in data.get('dependency-groups', {}).items():
+            lists.append((f"group[{group_name}]", deps))
+        return lists
+
+    def update_dependency(self, dep) -> Tuple[object, Optional[str]]:
+        """Updates a single dependency, returning the new entry and an update note (if any)"""
+        # Handle include-group entries (for dependency-groups)
+        if isinstance(dep, dict) and 'include-group' in dep:
+            return dep, None
+
+        # Parse the dependency
+        original_name, normalized_name, old_constraint, extras = self.parse_requirement(dep)
+
+        log.debug("  📦 Processing: %s", original_name)
+        log.debug("      Original constraint: '%s'", old_constraint)
+
+        # Extract current version from the dependency string
+        old_version = self.extract_version_from_constraint(old_constraint)
+        log.debug("      Extracted old version: '%s'", old_version)
+
+        if self.is_known_latest(normalized_name, old_version):
+            # Seen as the latest version in a recent run, no need to ask PyPI again
+            log.info("    ✓ %s: already latest (%s)", original_name, old_version)
+            return dep, None
+
+        # Get latest version from PyPI
+        latest_version = self.get_latest_version(normalized_name)
+
+        if not latest_version:
+            # Keep original if we couldn't get version info
+            log.warning("    ⚠️  %s: Could not fetch version, keeping original", original_name)
+            return dep, None
+
+        self.known_latest[canonicalize_name(normalized_name)] = (latest_version, time.time())
+        log.debug("      Latest from PyPI: '%s'", latest_version)
+
+        if old_version == latest_version:
+            # Already on the latest version, keep the entry exactly as written
+            log.info("    ✓ %s: already latest (%s)", original_name, latest_version)
+            return dep, None
+
+        # Check if this is actually an update needed
+        is_update_needed = self.is_version_newer(latest_version, old_version)
+        log.debug("      Update needed: %s", is_update_needed)
+
+        if not is_update_needed:
+            # Never rewrite a requirement to a lower minimum than it already has
+            log.info("    ✓ %s: already latest (%s)", original_name, old_version)
+            return dep, None
+
+        log.info("    ✅ %s: %s -> %s", original_name, old_version or 'none', latest_version)
+        return (f"{original_name}{extras}>={latest_version}",
+                f"{original_name}: {old_version or 'none'} -> {latest_version}")
+
     def update_dependency_list(self, dependencies: List[str], group_name: str = "main") -> Tuple[
         List[str], List[str]]:
         """Updates a list of dependencies to their latest versions"""
         print(f"🔄 Updating {group_name} dependencies...")
 
-        new_dependencies = []
-        updated_packages = []
-
-        for dep in dependencies:
-            if not dep or not dep.strip():
-                continue
-
-            # Handle include-group entries (for dependency-groups)
-            if isinstance(dep, dict) and 'include-group' in dep:
-                new_dependencies.append(dep)
-                continue
-
-            # Parse the dependency
-            original_name, normalized_name, old_constraint, extras = self.parse_requirement(dep)
-
-            print(f"  📦 Processing: {original_name}")
-            print(f"      Original constraint: '{old_constraint}'")
-
-            # Get latest version from PyPI
-            latest_version = self.get_latest_version(normalized_name)
-
-            if latest_version:
-                # Extract current version from the dependency string
-                old_version = self.extract_version_from_constraint(old_constraint)
-                print(f"      Extracted old version: '{old_version}'")
-                print(f"      Latest from PyPI: '{latest_version}'")
-
-                # Check if this is actually an update needed
-                is_update_needed = self.is_version_newer(latest_version, old_version)
-                print(f"      Update needed: {is_update_needed}")
-
-                # Always build new dependency string with latest version
-                new_dep = f"{original_name}{extras}>={latest_version}"
-                new_dependencies.append(new_dep)
-
-                if is_update_needed:
-                    updated_packages.append(
-                        f"{original_name}: {old_version or 'none'} -> {latest_version}")
-                    print(f"    ✅ {original_name}: {old_version or 'none'} -> {latest_version}")
-                else:
-                    print(f"    ✓ {original_name}: already latest ({latest_version})")
-            else:
-                # Keep original if we couldn't get version info
-                new_dependencies.append(dep)
-                print(f"    ⚠️  {original_name}: Could not fetch version, keeping original")
+        results = [self.update_dependency(dep) for dep in dependencies
+                   if isinstance(dep, dict) or (dep and dep.strip())]
+        new_dependencies = [new_dep for new_dep, _ in results]
+        updated_packages = [update for _, update in results if update]
 
         print(f"🔄 Finished updating {group_name} dependencies")
         return new_dependencies, updated_packages
@@ -378,123 +754,99 @@ class PackageUpdater:
 
         print(f"📖 Reading {self.pyproject_path}")
 
-        # Load pyproject.toml
-        with open(self.pyproject_path, 'rb') as f:
-            data = tomllib.load(f)
+        # Load pyproject.toml, keeping the raw bytes for the backup instead of copying data
+        self.original_content = self.pyproject_path.read_bytes()
+        data = toml_loads(self.original_content.decode('utf-8'))
 
         all_updated_packages = []
 
         print(f"\n🔍 Starting dependency updates...")
 
-        # Update main dependencies
-        if 'project' in data and 'dependencies' in data['project']:
-            dependencies = data['project']['dependencies']
-            if dependencies:
-                print(f"\n📋 Found {len(dependencies)} main dependencies")
-                new_deps, updated = self.update_dependency_list(dependencies, "main")
-                data['project']['dependencies'] = new_deps
-                all_updated_packages.extend(updated)
-            else:
-                print(f"\n📋 No main dependencies found")
-
-        # Update optional dependencies
-        if 'project' in data and 'optional-dependencies' in data['project']:
-            print(f"\n🔄 Updating optional dependencies...")
-
-            for group_name, deps in data['project']['optional-dependencies'].items():
-                if deps:
-                    print(f"\n  📋 Group '{group_name}' has {len(deps)} dependencies")
-                    new_deps, updated = self.update_dependency_list(deps, f"optional[{group_name}]")
-                    data['project']['optional-dependencies'][group_name] = new_deps
-                    all_updated_packages.extend(updated)
-                else:
-                    print(f"\n  📋 Group '{group_name}' is empty")
-
-        # Update dependency groups (PEP 735)
-        if 'dependency-groups' in data:
-            print(f"\n🔄 Updating dependency groups...")
-
-            for group_name, deps in data['dependency-groups'].items():
-                if deps:
-                    print(f"\n  📋 Group '{group_name}' has {len(deps)} dependencies")
-                    # Filter out include-group entries and process only regular dependencies
-                    regular_deps = [d for d in deps if
-                                    not (isinstance(d, dict) and 'include-group' in d)]
-                    include_groups = [d for d in deps if
-                                      isinstance(d, dict) and 'include-group' in d]
-
-                    if regular_deps:
-                        new_deps, updated = self.update_dependency_list(regular_deps,
-                                                                        f"group[{group_name}]")
-                        # Combine updated deps with include-groups
-                        data['dependency-groups'][group_name] = new_deps + include_groups
-                        all_updated_packages.extend(updated)
-                    else:
-                        # Only include-groups, keep as is
-                        print(f"    📋 Group contains only include-groups, keeping as is")
-                        data['dependency-groups'][group_name] = deps
-                else:
-                    print(f"\n  📋 Group '{group_name}' is empty")
-
-        # Check compatibility with UV
-        print(f"\n🔍 Checking dependency compatibility...")
-        if not self.check_uv_compatibility(data):
-            print(f"\n⚠️  Compatibility issues found! Attempting automatic resolution...")
+        # Index all dependency lists once; they are updated in place below
+        dependency_lists = self.dependency_lists(data)
+        self.load_known_latest()
 
-            # Try automatic conflict resolution first
+        requires_python = data.get('project', {}).get('requires-python')
+        if requires_python:
             try:
-                # Try to let UV resolve the dependencies and extract compatible versions
-                with tempfile.TemporaryDirectory() as temp_dir:
-                    temp_project_path = Path(temp_dir) / "pyproject.toml"
-
-                    # Write the conflicting config
-                    with open(temp_project_path, 'wb') as f:
-                        tomli_w.dump(data, f)
-
-                    # Try uv lock --upgrade to get compatible versions
-                    print("🔧 Using 'uv lock --upgrade' to find compatible versions...")
-                    result = subprocess.run(
-                        ['uv', 'lock', '--upgrade'],
-                        cwd=temp_dir,
-                        capture_output=True,
-                        text=True,
-                        timeout=120
-                    )
-
-                    if result.returncode == 0:
-                        # Read the generated lock file to extract compatible versions
-                        lock_path = Path(temp_dir) / "uv.lock"
-                        if lock_path.exists():
-                            print("✅ UV found compatible versions!")
+                self.python_version = self.lower_bound(requires_python)
+            except InvalidSpecifier:
+                print(f"⚠️  Warning: Could not parse requires-python '{requires_python}'")
+
+        # Resolve the packages of all sections in one pass, so packages shared between
+        # groups are only resolved once and the update loops below are served from the cache.
+        # Dependencies pinned to a recently seen latest version need no lookup at all.
+        lookup_names = []
+        uv_requirements = []
+        for _, deps in dependency_lists:
+            for dep in deps:
+                if isinstance(dep, str) and dep.strip():
+                    _, name, constraint, _ = self.parse_requirement(dep)
+                    old_version = self.extract_version_from_constraint(constraint)
+                    if not self.is_known_latest(name, old_version):
+                        lookup_names.append(name)
+                        # Keep the current lower bound, uv must not resolve below it, and the
+                        # marker, so platform-only dependencies are skipped instead of failing
+                        uv_requirement = f"{name}>={old_version}" if old_version else name
+                        try:
+                            marker = Requirement(dep).marker
+                        except InvalidRequirement:
+                            marker = None
+                        uv_requirements.append(f"{uv_requirement} ; {marker}" if marker else uv_requirement)
+        self.prefetch_package_info(lookup_names, uv_requirements)
+
+        # Snapshot of the entries, to tell whether the update loops changed anything
+        original_lists = [list(deps) for _, deps in dependency_lists]
+
+        # Update main, optional and PEP 735 group dependencies (include-groups pass through)
+        for group_label, deps in dependency_lists:
+            if not deps:
+                print(f"\n📋 No dependencies in {group_label}")
+                continue
 
-                            # Parse lock file and update pyproject.toml with compatible versions
-                            lock_content = lock_path.read_text()
+            print(f"\n📋 Found {len(deps)} dependencies in {group_label}")
+            new_deps, updated = self.update_dependency_list(deps, group_label)
+            deps[:] = new_deps
+            all_updated_packages.extend(updated)
 
-                            # Extract versions from lock file
-                            package_versions = {}
-                            lines = lock_content.split('\n')
-                            current_package = None
+        self.save_known_latest()
 
-                            for i, line in enumerate(lines):
-                                if 'name = "' in line:
-                                    current_package = line.split('"')[1].lower()
-                                elif 'version = "' in line and current_package:
-                                    version_str = line.split('"')[1]
-                                    package_versions[current_package] = version_str
-                                    current_package = None
+        if all(deps == original for (_, deps), original in zip(dependency_lists, original_lists)):
+            # The existing pyproject.toml is left as is, so there is nothing for UV to check
+            print("\n✅ All dependencies are up to date, nothing to change")
+            return
 
+        # Check compatibility with UV, while the 'uv lock --upgrade' fallback already runs
+        # next to it, so a failed check does not have to wait for a second resolution
+        print(f"\n🔍 Checking dependency compatibility...")
+        # Serialize once, the compatibility check and the final write share the result
+        content = tomli_w.dumps(data)
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                self.speculative_lock_upgrade(content, Path(temp_dir, 'upgrade')) as upgrade:
+            check_dir = Path(temp_dir, 'check')
+            if not self.check_uv_compatibility(content, check_dir):
+                print(f"\n⚠️  Compatibility issues found! Attempting automatic resolution...")
+
+                # Try automatic conflict resolution first
+                try:
+                    package_versions, error_output = self.resolve_with_uv_lock(
+                        Path(temp_dir, 'upgrade'), upgrade)
+
+                    if package_versions is not None:
+                        if package_versions:
+                            print("✅ UV found compatible versions!")
                             print(f"📋 Found {len(package_versions)} package versions in lock file")
 
                             # Update our data with compatible versions from lock file
                             data = self.apply_compatible_versions(data, package_versions)
+                            content = tomli_w.dumps(data)
                             all_updated_packages = []  # Reset since we're using UV's resolution
 
                             for pkg, ver in package_versions.items():
                                 all_updated_packages.append(f"{pkg}: -> {ver} (UV resolved)")
                     else:
                         print(f"❌ UV could not resolve dependencies automatically")
-                        if result.stderr:
-                            error_output = result.stderr
+                        if error_output:
                             print(error_output)
 
                             # Try automatic conflict resolution
@@ -502,9 +854,10 @@ class PackageUpdater:
 
                             if resolved_data != data:
                                 print("🔄 Testing resolved configuration...")
-                                if self.check_uv_compatibility(resolved_data):
+                                resolved_content = tomli_w.dumps(resolved_data)
+                                if self.check_uv_compatibility(resolved_content, check_dir):
                                     print("✅ Automatic conflict resolution successful!")
-                                    data = resolved_data
+                                    data, content = resolved_data, resolved_content
                                     # Add a note about the conflict resolution
                                     all_updated_packages.append(
                                         "CONFLICT RESOLVED: Removed safety package for psutil>=7.0.0 compatibility")
@@ -516,9 +869,9 @@ class PackageUpdater:
                                 print("❌ No automatic resolution available")
                                 self.print_manual_resolution_suggestions(error_output)
 
-            except Exception as e:
-                print(f"❌ Error during conflict resolution: {e}")
-                print("📝 Proceeding with updated versions (manual resolution may be needed)")
+                except Exception as e:
+                    print(f"❌ Error during conflict resolution: {e}")
+                    print("📝 Proceeding with updated versions (manual resolution may be needed)")
 
         # Display results
         print(f"\n📊 Summary:")
@@ -539,8 +892,12 @@ class PackageUpdater:
             # Always write the file to update to latest versions
             self.create_backup()
 
-            with open(self.pyproject_path, 'wb') as f:
-                tomli_w.dump(data, f)
+            # Serialize in memory and swap the file in atomically, so an interrupted
+            # write can never leave a truncated pyproject.toml behind
+            temp_path = self.pyproject_path.with_suffix('.toml.tmp')
+            temp_path.write_bytes(content.encode('utf-8'))
+            shutil.copymode(self.pyproject_path, temp_path)
+            os.replace(temp_path, self.pyproject_path)
 
             print(f"\n✅ {self.pyproject_path} successfully updated with compatible versions!")
             print("💡 Run 'uv lock' to update the uv.lock file")
@@ -577,6 +934,21 @@ def main():
         action="store_true",
         help="Don't create a backup of pyproject.toml"
     )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Look up every package again instead of trusting recently cached PyPI data"
+    )
+    parser.add_argument(
+        "--pre",
+        action="store_true",
+        help="Allow updating to pre-release versions"
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Show details of how each dependency was checked"
+    )
     parser.add_argument(
         "--pyproject",
         type=Path,
@@ -586,13 +958,18 @@ def main():
 
     args = parser.parse_args()
 
+    logging.basicConfig(stream=sys.stdout, format="%(message)s")
+    log.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+
     print("🦄 UV Keiko - Smart Dependency Updater")
     print("=" * 50)
 
     updater = PackageUpdater(
         pyproject_path=args.pyproject,
         dry_run=args.dry_run,
-        backup=not args.no_backup
+        backup=not args.no_backup,
+        refresh=args.refresh,
+        allow_prereleases=args.pre
     )
 
     try:
@@ -9,43 +9,132 @@ Prerequisites:
 - Python 3.11+
 - requests: pip install requests
 - packaging: pip install packaging
+- orjson (optional, faster parsing of registry responses and lock files): pip install orjson
+- ijson (optional, streams large package-lock.json files): pip install ijson
 - yarn: npm install -g yarn (or use npm instead)
 
 Usage:
-python yarn-keiko.py [--dry-run] [--no-backup] [--package-json PATH] [--use-npm]
+python yarn-keiko.py [--dry-run] [--no-backup] [--refresh] [--package-json PATH] [--use-npm] [--verbose]
 """
 
 import argparse
+import functools
 import json
+import logging
+import os
 import re
 import shutil
 import subprocess
 import sys
 import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
 try:
     import requests
     from packaging import version
+    from urllib3.util.retry import Retry
 except ImportError as e:
     print(f"Error: Required library not installed: {e}")
     print("Install with: pip install requests packaging")
     sys.exit(1)
 
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Parsed versions are cached, the same latest versions are compared by the update loops
+# and again by the alignment passes
+parse_version = functools.lru_cache(maxsize=None)(version.parse)
+
+# package.json sections that are updated (peerDependencies are left as they are)
+DEPENDENCY_GROUPS = ('dependencies', 'devDependencies', 'optionalDependencies')
+
+# Packages the alignment checks look up when the compatibility check fails
+ALIGNMENT_PACKAGES = frozenset({'@types/react', '@types/react-dom', 'typescript', 'eslint'})
+
+# Maximum number of concurrent requests to the npm registry
+MAX_WORKERS = 20
+
+# Maximum number of retries for failed registry requests (rate limits, server and connection errors)
+MAX_RETRIES = 3
+
+# Content type of npm's abbreviated packument ("corgi"), which omits per-version metadata
+ABBREVIATED_PACKUMENT_CONTENT_TYPE = 'application/vnd.npm.install-v1+json'
+
+# Splits a version constraint like '^1.2.3' into its operator and version
+CONSTRAINT_PATTERN = re.compile(r'^([~^>=<]*)(.+)$')
+
+# Registry responses are cached on disk and revalidated with ETag / Last-Modified
+CACHE_DIR = Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / 'yarn-keiko'
+
+# Latest versions seen in recent runs, dependencies already on them are not looked up again
+KNOWN_LATEST_PATH = CACHE_DIR / 'known_latest.json'
+KNOWN_LATEST_TTL = 5 * 60
+
+# Per-package results are logged at info level; the debug details are skipped without --verbose
+log = logging.getLogger('yarn-keiko')
+
 
 class PackageUpdater:
-    def __init__(self, package_json_path: Path, dry_run: bool = False, backup: bool = True, use_npm: bool = False):
+    def __init__(self, package_json_path: Path, dry_run: bool = False, backup: bool = True, use_npm: bool = False,
+                 refresh: bool = False):
         self.package_json_path = package_json_path
         self.dry_run = dry_run
         self.backup = backup
+        self.refresh = refresh
         self.use_npm = use_npm
         self.package_manager = "npm" if use_npm else "yarn"
         self.session = requests.Session()
         self.session.headers.update({'User-Agent': 'Yarn-Keiko/1.0'})
 
-        # Cache for npm registry requests
-        self.package_cache: Dict[str, dict] = {}
+        # One kept-alive connection per worker, so concurrent fetches reuse TLS sessions, and
+        # retries with exponential backoff (honouring Retry-After when rate limited)
+        retries = Retry(total=MAX_RETRIES, backoff_factor=0.5,
+                        status_forcelist=[429, 500, 502, 503, 504],
+                        allowed_methods=['GET'], raise_on_status=False)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=MAX_WORKERS,
+                                                pool_maxsize=MAX_WORKERS, max_retries=retries)
+        self.session.mount('https://', adapter)
+
+        # Cache for npm registry requests (None marks packages that could not be fetched)
+        self.package_cache: Dict[str, Optional[dict]] = {}
+
+        # Latest versions seen in recent runs: package name -> (version, timestamp)
+        self.known_latest: Dict[str, Tuple[str, float]] = {}
+
+    def load_known_latest(self) -> None:
+        """Loads the latest versions seen within the last KNOWN_LATEST_TTL seconds"""
+        try:
+            entries = json_loads(KNOWN_LATEST_PATH.read_bytes())
+            cutoff = time.time() - KNOWN_LATEST_TTL
+            self.known_latest = {name: (ver, seen) for name, (ver, seen) in entries.items()
+                                 if seen >= cutoff}
+        except (OSError, ValueError, TypeError, AttributeError):
+            self.known_latest = {}  # Missing or corrupt, start over
+
+    def save_known_latest(self) -> None:
+        """Stores the latest versions seen in this run for later runs"""
+        try:
+            KNOWN_LATEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+            KNOWN_LATEST_PATH.write_text(json.dumps(self.known_latest))
+        except OSError as e:
+            print(f"⚠️  Warning: Could not write cache file {KNOWN_LATEST_PATH}: {e}")
+
+    def is_known_latest(self, package_name: str, pinned_version: Optional[str]) -> bool:
+        """Checks if a pinned version was recently seen as the latest version of a package"""
+        if self.refresh:
+            return False
+        known = self.known_latest.get(package_name)
+        return pinned_version is not None and known is not None and known[0] == pinned_version
 
     def create_backup(self) -> None:
         """Creates a backup of the package.json file"""
@@ -54,6 +143,57 @@ class PackageUpdater:
             shutil.copy2(self.package_json_path, backup_path)
             print(f"✓ Backup created: {backup_path}")
 
+    def _fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        """Performs a GET request against the npm registry (the session adapter retries errors)"""
+        response = self.session.get(url, headers=headers, timeout=15)
+        response.raise_for_status()
+        return response
+
+    def _fetch_json(self, url: str, cache_path: Path, fields: Tuple[str, ...],
+                    headers: Optional[Dict[str, str]] = None) -> dict:
+        """Fetches the given top-level fields of a registry JSON document, cached on disk"""
+        request_headers = dict(headers or {})
+        meta_path = cache_path.with_suffix('.meta')
+
+        try:
+            cached = cache_path.read_bytes()
+            meta = json_loads(meta_path.read_bytes()) if meta_path.exists() else {}
+        except (OSError, ValueError):
+            cached, meta = None, {}
+
+        if cached is not None:
+            # Revalidate the cached copy, the registry answers 304 without a body if it is current
+            if meta.get('etag'):
+                request_headers['If-None-Match'] = meta['etag']
+            if meta.get('last-modified'):
+                request_headers['If-Modified-Since'] = meta['last-modified']
+
+        response = self._fetch(url, headers=request_headers)
+
+        if response.status_code == 304 and cached is not None:
+            try:
+                data = json_loads(cached)
+                return {field: data[field] for field in fields if field in data}
+            except ValueError:
+                # Corrupt cache entry, fetch a fresh copy
+                response = self._fetch(url, headers=headers)
+
+        # Keep only the fields we read, packuments carry the metadata of every version ever
+        data = json_loads(response.content)
+        data = {field: data[field] for field in fields if field in data}
+
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            cache_path.write_text(json.dumps(data))
+            meta_path.write_text(json.dumps({
+                'etag': response.headers.get('ETag'),
+                'last-modified': response.headers.get('Last-Modified'),
+            }))
+        except OSError as e:
+            print(f"⚠️  Warning: Could not write cache file {cache_path}: {e}")
+
+        return data
+
     def get_package_info(self, package_name: str) -> Optional[dict]:
         """Fetches package information from npm registry"""
         if package_name in self.package_cache:
@@ -63,17 +203,29 @@ class PackageUpdater:
             # Handle scoped packages (e.g., @types/node)
             encoded_name = package_name.replace('/', '%2F')
             url = f"https://registry.npmjs.org/{encoded_name}"
-            response = self.session.get(url, timeout=15)
-            response.raise_for_status()
-
-            data = response.json()
+            # Only the dist-tags are read, by get_latest_version and the alignment helpers,
+            # and the abbreviated packument has them at a fraction of the full document's size
+            data = self._fetch_json(url, CACHE_DIR / 'npmMetadata' / f"{package_name}.json",
+                                    fields=('dist-tags',),
+                                    headers={'Accept': ABBREVIATED_PACKUMENT_CONTENT_TYPE})
             self.package_cache[package_name] = data
             return data
 
-        except requests.RequestException as e:
+        except (requests.RequestException, ValueError) as e:
             print(f"⚠️  Warning: Could not fetch package info for {package_name}: {e}")
+            self.package_cache[package_name] = None
             return None
 
+    def prefetch_package_info(self, package_names: List[str]) -> None:
+        """Fetches package information for multiple packages concurrently"""
+        unique_names = [name for name in set(package_names) if name not in self.package_cache]
+        if not unique_names:
+            return
+
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(unique_names))) as executor:
+            # Results land in package_cache, so we only need to wait for completion
+            list(executor.map(self.get_package_info, unique_names))
+
     def get_latest_version(self, package_name: str) -> Optional[str]:
         """Gets the latest stable version of a package from npm registry"""
         info = self.get_package_info(package_name)
@@ -83,7 +235,7 @@ class PackageUpdater:
         # Get the latest version from npm registry
         latest = info.get('dist-tags', {}).get('latest')
         if latest:
-            print(f"  📡 npm latest for {package_name}: {latest}")
+            log.debug("  📡 npm latest for %s: %s", package_name, latest)
             return latest
 
         return None
@@ -94,7 +246,7 @@ class PackageUpdater:
             return "", None
 
         # Handle common patterns: ^1.2.3, ~1.2.3, >=1.2.3, 1.2.3, etc.
-        match = re.match(r'^([~^>=<]*)(.+)$', constraint.strip())
+        match = CONSTRAINT_PATTERN.match(constraint.strip())
         if match:
             operator = match.group(1)
             version_str = match.group(2)
@@ -105,90 +257,176 @@ class PackageUpdater:
     def extract_version_from_constraint(self, constraint: str) -> Optional[str]:
         """Extracts version number from a constraint string like '^1.2.3'"""
         if not constraint:
-            print(f"      DEBUG: No constraint found")
+            log.debug("      No constraint found")
             return None
 
         # Remove operators and get just the version
         _, version_str = self.parse_version_constraint(constraint)
         if version_str:
-            print(f"      DEBUG: Extracted '{version_str}' from constraint '{constraint}'")
+            log.debug("      Extracted '%s' from constraint '%s'", version_str, constraint)
             return version_str
 
-        print(f"      DEBUG: Could not extract version from constraint '{constraint}'")
+        log.debug("      Could not extract version from constraint '%s'", constraint)
         return None
 
     def is_version_newer(self, new_version: str, old_version: Optional[str]) -> bool:
         """Checks if new_version is newer than old_version"""
         if not old_version:
-            print(f"      DEBUG: No old version, considering update needed")
+            log.debug("      No old version, considering update needed")
             return True
 
+        # Identical strings are never newer, no need to parse them
+        if new_version == old_version:
+            log.debug("      %s equals %s, no update needed", new_version, old_version)
+            return False
+
         try:
-            new_parsed = version.parse(new_version)
-            old_parsed = version.parse(old_version)
+            new_parsed = parse_version(new_version)
+            old_parsed = parse_version(old_version)
             is_newer = new_parsed > old_parsed
-            print(f"      DEBUG: Comparing {new_version} > {old_version} = {is_newer}")
+            log.debug("      Comparing %s > %s = %s", new_version, old_version, is_newer)
             return is_newer
         except version.InvalidVersion as e:
-            print(f"      DEBUG: Version parsing error ({e}), assuming update needed")
+            log.debug("      Version parsing error (%s), assuming update needed", e)
             return True  # Assume it's newer if we can't parse
 
-    def check_package_manager_compatibility(self, data: dict) -> bool:
+    @functools.cached_property
+    def package_manager_path(self) -> Optional[str]:
+        """Location of the yarn/npm executable (None if it is not installed), looked up once"""
+        return shutil.which(self.package_manager)
+
+    def run_package_manager(self, args: List[str], cwd: Path) -> subprocess.CompletedProcess:
+        """Runs a yarn/npm command in cwd and captures its output as bytes"""
+        return subprocess.run(
+            [self.package_manager, *args],
+            cwd=cwd,
+            capture_output=True,
+            # Output is only decoded when the command failed and it gets printed
+            text=False,
+            timeout=120
+        )
+
+    def check_package_manager_compatibility(self, data: dict, project_dir: Path) -> bool:
         """Test if the current package.json configuration is compatible using yarn/npm"""
-        if not shutil.which(self.package_manager):
+        if not self.package_manager_path:
             print(f"⚠️  {self.package_manager} is not installed. Skipping compatibility check.")
             return True
 
         try:
-            # Create temporary directory and write package.json there
-            with tempfile.TemporaryDirectory() as temp_dir:
-                temp_path = Path(temp_dir) / 'package.json'
-
-                with open(temp_path, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, indent=2)
-
-                print(f"🔍 Testing dependency compatibility with {self.package_manager}...")
-
-                # Test with yarn install --dry-run or npm install --dry-run
-                cmd = [self.package_manager, 'install', '--dry-run']
-                if self.use_npm:
-                    # npm doesn't have --dry-run for install, use audit dry-run instead
-                    result = subprocess.run(
-                        [self.package_manager, 'audit', '--dry-run'],
-                        cwd=temp_dir,
-                        capture_output=True,
-                        text=True,
-                        timeout=120
-                    )
-                    # For npm, we'll consider it successful if audit doesn't fail catastrophically
-                    if result.returncode in [0, 1]:  # 1 is common for audit warnings
-                        print("✅ Dependency compatibility check passed!")
-                        return True
-                else:
-                    result = subprocess.run(
-                        cmd,
-                        cwd=temp_dir,
-                        capture_output=True,
-                        text=True,
-                        timeout=120
-                    )
-
-                if result.returncode == 0:
+            # Write package.json into the scratch project directory
+            with open(project_dir / 'package.json', 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+
+            print(f"🔍 Testing dependency compatibility with {self.package_manager}...")
+
+            if self.use_npm:
+                # npm doesn't have --dry-run for install, use audit dry-run instead
+                result = self.run_package_manager(['audit', '--dry-run'], cwd=project_dir)
+                # For npm, we'll consider it successful if audit doesn't fail catastrophically
+                if result.returncode in [0, 1]:  # 1 is common for audit warnings
                     print("✅ Dependency compatibility check passed!")
                     return True
-                else:
-                    print("❌ Dependency compatibility check failed!")
-                    print(f"{self.package_manager.title()} Error:")
-                    if result.stderr:
-                        print(result.stderr)
-                    if result.stdout:
-                        print(result.stdout)
-                    return False
+            else:
+                result = self.run_package_manager(['install', '--dry-run'], cwd=project_dir)
+
+            if result.returncode == 0:
+                print("✅ Dependency compatibility check passed!")
+                return True
+            else:
+                print("❌ Dependency compatibility check failed!")
+                print(f"{self.package_manager.title()} Error:")
+                if result.stderr:
+                    print(result.stderr.decode('utf-8', 'replace'))
+                if result.stdout:
+                    print(result.stdout.decode('utf-8', 'replace'))
+                return False
 
         except Exception as e:
             print(f"⚠️  Error during compatibility check: {e}")
             return True  # Assume compatible if we can't test
 
+    def resolve_with_package_manager(self, project_dir: Path) -> Tuple[Optional[Dict[str, str]], str]:
+        """Lets yarn/npm generate a lock file for the project in project_dir
+
+        Returns the package versions from the lock file (None if the package manager failed)
+        and its error output.
+        """
+        print(f"🔧 Using '{self.package_manager} install' to find compatible versions...")
+
+        if self.use_npm:
+            result = self.run_package_manager(['install', '--package-lock-only'], cwd=project_dir)
+        else:
+            result = self.run_package_manager(['install', '--mode=update-lockfile'], cwd=project_dir)
+
+        if result.returncode != 0:
+            return None, result.stderr.decode('utf-8', 'replace')
+
+        # Read the generated lock file to extract compatible versions
+        if self.use_npm:
+            lock_file = project_dir / "package-lock.json"
+        else:
+            lock_file = project_dir / "yarn.lock"
+
+        if not lock_file.exists():
+            return {}, ''
+
+        print(f"📋 Reading {lock_file.name} for compatible versions...")
+
+        if self.use_npm:
+            package_versions = self.parse_package_lock(lock_file)
+        else:
+            package_versions = self.parse_yarn_lock(lock_file)
+
+        return package_versions, ''
+
+    @staticmethod
+    def parse_package_lock(lock_file: Path) -> Dict[str, str]:
+        """Reads the package versions from a package-lock.json"""
+        package_versions = {}
+
+        with open(lock_file, 'rb') as f:
+            if ijson is not None:
+                # Stream the entries instead of loading lock files of tens of megabytes at once
+                packages = ijson.kvitems(f, 'packages')
+            else:
+                packages = json_loads(f.read()).get('packages', {}).items()
+
+            for path, info in packages:
+                if path.startswith('node_modules/') and 'version' in info:
+                    package_versions[path[13:]] = info['version']  # Remove 'node_modules/'
+
+        return package_versions
+
+    @staticmethod
+    def parse_yarn_lock(lock_file: Path) -> Dict[str, str]:
+        """Reads the package versions from a yarn.lock (classic or Berry format) line by line"""
+        package_versions = {}
+        entry_names = []
+
+        with open(lock_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip() or line.startswith('#'):
+                    continue
+
+                if not line[0].isspace():
+                    # Entry header like '"@scope/pkg@^1.0.0", "@scope/pkg@^1.2.0":'
+                    entry_names = []
+                    for descriptor in line.rstrip().rstrip(':').split(','):
+                        descriptor = descriptor.strip().strip('"')
+                        # The name ends at the first '@' that doesn't start a scope
+                        separator = descriptor.find('@', 1)
+                        name = descriptor[:separator] if separator > 0 else descriptor
+                        if name and not name.startswith('__') and name not in entry_names:
+                            entry_names.append(name)  # '__metadata' is Berry's file header
+                elif entry_names and line.startswith('  version') and not line.startswith('   '):
+                    # 'version "1.2.3"' (classic) or 'version: 1.2.3' (Berry)
+                    _, _, value = line.strip().partition(' ')
+                    for name in entry_names:
+                        package_versions[name] = value.strip().strip('"')
+                    entry_names = []
+
+        return package_versions
+
     def auto_resolve_common_conflicts(self, data: dict, error_output: str) -> dict:
         """Automatically resolve common dependency conflicts"""
         print("🔧 Auto-resolving common frontend conflicts...")
@@ -327,48 +565,54 @@ class PackageUpdater:
 
         return data
 
-    def update_dependency_group(self, dependencies: Dict[str, str], group_name: str = "dependencies") -> Tuple[
-        Dict[str, str], List[str]]:
-        """Updates a group of dependencies to their latest versions"""
+    def update_dependency_group(self, dependencies: Dict[str, str], group_name: str = "dependencies") -> List[str]:
+        """Updates a group of dependencies to their latest versions in place"""
         print(f"🔄 Updating {group_name}...")
 
-        new_dependencies = {}
         updated_packages = []
 
         for pkg_name, current_constraint in dependencies.items():
-            print(f"  📦 Processing: {pkg_name}")
-            print(f"      Current constraint: '{current_constraint}'")
+            log.debug("  📦 Processing: %s", pkg_name)
+            log.debug("      Current constraint: '%s'", current_constraint)
+
+            # Extract current version from the constraint
+            old_version = self.extract_version_from_constraint(current_constraint)
+            log.debug("      Extracted old version: '%s'", old_version)
+
+            if self.is_known_latest(pkg_name, old_version):
+                # Seen as the latest version in a recent run, no need to ask the registry again;
+                # still normalise the constraint, so the result does not depend on the cache
+                dependencies[pkg_name] = f"^{old_version}"
+                log.info("    ✓ %s: already latest (%s)", pkg_name, old_version)
+                continue
 
             # Get latest version from npm registry
             latest_version = self.get_latest_version(pkg_name)
 
             if latest_version:
-                # Extract current version from the constraint
-                old_version = self.extract_version_from_constraint(current_constraint)
-                print(f"      Extracted old version: '{old_version}'")
-                print(f"      Latest from npm: '{latest_version}'")
+                self.known_latest[pkg_name] = (latest_version, time.time())
+                log.debug("      Latest from npm: '%s'", latest_version)
 
                 # Check if this is actually an update needed
                 is_update_needed = self.is_version_newer(latest_version, old_version)
-                print(f"      Update needed: {is_update_needed}")
+                log.debug("      Update needed: %s", is_update_needed)
 
-                # Use ^ prefix for semantic versioning (most common in frontend)
-                new_constraint = f"^{latest_version}"
-                new_dependencies[pkg_name] = new_constraint
+                # Use ^ prefix for semantic versioning (most common in frontend); replacing
+                # the value of an existing key is safe while iterating and keeps the order
+                dependencies[pkg_name] = f"^{latest_version}"
 
                 if is_update_needed:
                     updated_packages.append(
                         f"{pkg_name}: {old_version or 'none'} -> {latest_version}")
-                    print(f"    ✅ {pkg_name}: {old_version or 'none'} -> {latest_version}")
+                    log.info("    ✅ %s: %s -> %s", pkg_name, old_version or 'none', latest_version)
                 else:
-                    print(f"    ✓ {pkg_name}: already latest ({latest_version})")
+                    log.info("    ✓ %s: already latest (%s)", pkg_name, latest_version)
             else:
                 # Keep original if we couldn't get version info
-                new_dependencies[pkg_name] = current_constraint
-                print(f"    ⚠️  {pkg_name}: Could not fetch version, keeping original")
+                log.warning("    ⚠️  %s: Could not fetch version, keeping original", pkg_name)
 
         print(f"🔄 Finished updating {group_name}")
-        return new_dependencies, updated_packages
+        return updated_packages
 
     def update_package_json(self) -> None:
         """Updates the package.json with the latest versions"""
@@ -379,117 +623,80 @@ class PackageUpdater:
         print(f"📖 Reading {self.package_json_path}")
 
         # Load package.json
-        with open(self.package_json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = json_loads(self.package_json_path.read_bytes())
 
         all_updated_packages = []
 
         print(f"\n🔍 Starting dependency updates...")
 
+        # Fetch the registry data of all groups at once, the update loops below then
+        # only hit the cache instead of waiting for one request after another.
+        # Dependencies pinned to a recently seen latest version need no lookup at all, except
+        # the packages the alignment checks after a failed install always look up.
+        self.load_known_latest()
+        self.prefetch_package_info([
+            pkg_name for group in DEPENDENCY_GROUPS
+            for pkg_name, constraint in (data.get(group) or {}).items()
+            if pkg_name in ALIGNMENT_PACKAGES
+            or not self.is_known_latest(pkg_name, self.extract_version_from_constraint(constraint))
+        ])
+
+        # Snapshot of the groups, to tell whether the update loops changed anything
+        original_groups = [dict(data.get(group) or {}) for group in DEPENDENCY_GROUPS]
+
         # Update main dependencies
         if 'dependencies' in data and data['dependencies']:
             print(f"\n📋 Found {len(data['dependencies'])} main dependencies")
-            new_deps, updated = self.update_dependency_group(data['dependencies'], "dependencies")
-            data['dependencies'] = new_deps
-            all_updated_packages.extend(updated)
+            all_updated_packages.extend(self.update_dependency_group(data['dependencies'], "dependencies"))
         else:
             print(f"\n📋 No main dependencies found")
 
         # Update devDependencies
         if 'devDependencies' in data and data['devDependencies']:
             print(f"\n📋 Found {len(data['devDependencies'])} dev dependencies")
-            new_deps, updated = self.update_dependency_group(data['devDependencies'], "devDependencies")
-            data['devDependencies'] = new_deps
-            all_updated_packages.extend(updated)
+            all_updated_packages.extend(self.update_dependency_group(data['devDependencies'], "devDependencies"))
         else:
             print(f"\n📋 No dev dependencies found")
 
         # Update optionalDependencies if they exist
         if 'optionalDependencies' in data and data['optionalDependencies']:
             print(f"\n📋 Found {len(data['optionalDependencies'])} optional dependencies")
-            new_deps, updated = self.update_dependency_group(data['optionalDependencies'], "optionalDependencies")
-            data['optionalDependencies'] = new_deps
-            all_updated_packages.extend(updated)
-
-        # Check compatibility with package manager
-        print(f"\n🔍 Checking dependency compatibility...")
-        if not self.check_package_manager_compatibility(data):
-            print(f"\n⚠️  Compatibility issues found! Attempting automatic resolution...")
-
-            # Try automatic conflict resolution
-            try:
-                # Create a test directory and try to install
-                with tempfile.TemporaryDirectory() as temp_dir:
-                    temp_package_path = Path(temp_dir) / "package.json"
+            all_updated_packages.extend(self.update_dependency_group(data['optionalDependencies'], "optionalDependencies"))
 
-                    # Write the conflicting config
-                    with open(temp_package_path, 'w', encoding='utf-8') as f:
-                        json.dump(data, f, indent=2)
+        self.save_known_latest()
 
-                    # Try package manager install to get compatible versions
-                    print(f"🔧 Using '{self.package_manager} install' to find compatible versions...")
+        if original_groups == [data.get(group) or {} for group in DEPENDENCY_GROUPS]:
+            # The existing package.json is left as is, so there is nothing to check
+            print("\n✅ All dependencies are up to date, nothing to change")
+            return
 
-                    if self.use_npm:
-                        install_cmd = ['npm', 'install', '--package-lock-only']
-                    else:
-                        install_cmd = ['yarn', 'install', '--mode=update-lockfile']
+        # Check compatibility with package manager, reusing one scratch project for the
+        # check and the fallback instead of writing package.json into a second one
+        print(f"\n🔍 Checking dependency compatibility...")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            if not self.check_package_manager_compatibility(data, Path(temp_dir)):
+                print(f"\n⚠️  Compatibility issues found! Attempting automatic resolution...")
 
-                    result = subprocess.run(
-                        install_cmd,
-                        cwd=temp_dir,
-                        capture_output=True,
-                        text=True,
-                        timeout=120
-                    )
+                # Try automatic conflict resolution
+                try:
+                    # The conflicting config is already in temp_dir from the check above
+                    package_versions, error_output = self.resolve_with_package_manager(Path(temp_dir))
 
-                    if result.returncode == 0:
+                    if package_versions is not None:
                         print(f"✅ {self.package_manager.title()} found compatible versions!")
 
-                        # Read the generated lock file to extract compatible versions
-                        if self.use_npm:
-                            lock_file = Path(temp_dir) / "package-lock.json"
-                        else:
-                            lock_file = Path(temp_dir) / "yarn.lock"
-
-                        if lock_file.exists():
-                            print(f"📋 Reading {lock_file.name} for compatible versions...")
-
-                            # Parse lock file and extract versions
-                            package_versions = {}
-
-                            if self.use_npm:
-                                # Parse package-lock.json
-                                with open(lock_file, 'r', encoding='utf-8') as f:
-                                    lock_data = json.load(f)
-                                    if 'packages' in lock_data:
-                                        for path, info in lock_data['packages'].items():
-                                            if path.startswith('node_modules/'):
-                                                pkg_name = path[13:]  # Remove 'node_modules/'
-                                                if 'version' in info:
-                                                    package_versions[pkg_name] = info['version']
-                            else:
-                                # Parse yarn.lock (simplified)
-                                with open(lock_file, 'r', encoding='utf-8') as f:
-                                    content = f.read()
-                                    # Simple regex to extract package@version
-                                    matches = re.findall(r'^"?([^@\s]+)@.*?:\s*version\s+"([^"]+)"', content,
-                                                         re.MULTILINE)
-                                    for pkg_name, pkg_version in matches:
-                                        package_versions[pkg_name] = pkg_version
-
-                            if package_versions:
-                                print(f"📋 Found {len(package_versions)} package versions in lock file")
-                                # Update our data with compatible versions from lock file
-                                data = self.apply_compatible_versions(data, package_versions)
-                                all_updated_packages = []  # Reset since we're using resolved versions
-                                for pkg, ver in list(package_versions.items())[:10]:  # Show first 10
-                                    all_updated_packages.append(f"{pkg}: -> {ver} (resolved)")
-                                if len(package_versions) > 10:
-                                    all_updated_packages.append(f"... and {len(package_versions) - 10} more packages")
+                        if package_versions:
+                            print(f"📋 Found {len(package_versions)} package versions in lock file")
+                            # Update our data with compatible versions from lock file
+                            data = self.apply_compatible_versions(data, package_versions)
+                            all_updated_packages = []  # Reset since we're using resolved versions
+                            for pkg, ver in list(package_versions.items())[:10]:  # Show first 10
+                                all_updated_packages.append(f"{pkg}: -> {ver} (resolved)")
+                            if len(package_versions) > 10:
+                                all_updated_packages.append(f"... and {len(package_versions) - 10} more packages")
                     else:
                         print(f"❌ {self.package_manager.title()} could not resolve dependencies automatically")
-                        if result.stderr:
-                            error_output = result.stderr
+                        if error_output:
                             print(error_output)
 
                             # Try automatic conflict resolution
@@ -497,7 +704,7 @@ class PackageUpdater:
 
                             if resolved_data != data:
                                 print("🔄 Testing resolved configuration...")
-                                if self.check_package_manager_compatibility(resolved_data):
+                                if self.check_package_manager_compatibility(resolved_data, Path(temp_dir)):
                                     print("✅ Automatic conflict resolution successful!")
                                     data = resolved_data
                                     all_updated_packages.append("CONFLICT RESOLVED: Applied automatic fixes")
@@ -508,9 +715,9 @@ class PackageUpdater:
                                 print("❌ No automatic resolution available")
                                 self.print_manual_resolution_suggestions(error_output)
 
-            except Exception as e:
-                print(f"❌ Error during conflict resolution: {e}")
-                print("📝 Proceeding with updated versions (manual resolution may be needed)")
+                except Exception as e:
+                    print(f"❌ Error during conflict resolution: {e}")
+                    print("📝 Proceeding with updated versions (manual resolution may be needed)")
 
         # Display results
         print(f"\n📊 Summary:")
@@ -583,6 +790,11 @@ def main():
         action="store_true",
         help="Don't create a backup of package.json"
     )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Look up every package again instead of trusting recently seen latest versions"
+    )
     parser.add_argument(
         "--package-json",
         type=Path,
@@ -594,9 +806,17 @@ def main():
         action="store_true",
         help="Use npm instead of yarn for compatibility checks"
     )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Show details of how each dependency was checked"
+    )
 
     args = parser.parse_args()
 
+    logging.basicConfig(stream=sys.stdout, format="%(message)s")
+    log.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+
     print("🦄 Yarn Keiko - Smart Frontend Dependency Updater")
     print("=" * 50)
 
@@ -604,7 +824,8 @@ def main():
         package_json_path=args.package_json,
         dry_run=args.dry_run,
         backup=not args.no_backup,
-        use_npm=args.use_npm
+        use_npm=args.use_npm,
+        refresh=args.refresh
     )
 
     try: